@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest import TestCase, main
+
+from biz.gitea.webhook_handler import PullRequestHandler
+
+
+class TestPullRequestHandler(TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.sample_webhook_data = {
+            'action': 'opened',
+            'pull_request': {
+                'number': 1,
+                'base': {
+                    'repo': {
+                        'owner': {'login': 'owner'},
+                        'name': 'repo'
+                    }
+                }
+            }
+        }
+        self.gitea_token = ''
+        self.gitea_url = 'https://gitea.example.com'
+
+        # 创建PullRequestHandler实例
+        self.handler = PullRequestHandler(self.sample_webhook_data, self.gitea_token, self.gitea_url)
+
+    def test_split_diff_by_file_multiple_files(self):
+        """测试多文件diff按文件名切分"""
+        diff_lines = [
+            'diff --git a/foo.py b/foo.py',
+            'index 123..456 100644',
+            '--- a/foo.py',
+            '+++ b/foo.py',
+            '@@ -1 +1 @@',
+            '-old',
+            '+new',
+            'diff --git a/bar.py b/bar.py',
+            'index 789..abc 100644',
+            '--- a/bar.py',
+            '+++ b/bar.py',
+            '@@ -1 +1 @@',
+            '-x',
+            '+y',
+        ]
+
+        file_diffs = self.handler._split_diff_by_file(iter(diff_lines))
+
+        self.assertEqual(set(file_diffs), {'foo.py', 'bar.py'})
+        self.assertEqual(file_diffs['foo.py'], '\n'.join(diff_lines[:7]))
+        self.assertEqual(file_diffs['bar.py'], '\n'.join(diff_lines[7:]))
+
+    def test_split_diff_by_file_flushes_last_file(self):
+        """测试最后一个文件的段落在迭代结束后也被收录"""
+        diff_lines = [
+            'diff --git a/only.py b/only.py',
+            '@@ -1 +1 @@',
+            '+added',
+        ]
+
+        file_diffs = self.handler._split_diff_by_file(iter(diff_lines))
+
+        self.assertEqual(file_diffs, {'only.py': '\n'.join(diff_lines)})
+
+    def test_split_diff_by_file_header_without_b_side(self):
+        """测试缺少 b/ 路径的diff头不产生条目，后续文件不受影响"""
+        diff_lines = [
+            'diff --git malformed header',
+            '@@ -1 +1 @@',
+            '-dropped',
+            'diff --git a/ok.py b/ok.py',
+            '@@ -1 +1 @@',
+            '+kept',
+        ]
+
+        file_diffs = self.handler._split_diff_by_file(iter(diff_lines))
+
+        self.assertEqual(set(file_diffs), {'ok.py'})
+        self.assertEqual(file_diffs['ok.py'], '\n'.join(diff_lines[3:]))
+
+    def test_split_diff_by_file_rename_uses_b_side_path(self):
+        """测试重命名时以 b/ 侧的新路径作为键"""
+        diff_lines = [
+            'diff --git a/old_name.py b/new_name.py',
+            'similarity index 100%',
+            'rename from old_name.py',
+            'rename to new_name.py',
+        ]
+
+        file_diffs = self.handler._split_diff_by_file(iter(diff_lines))
+
+        self.assertIn('new_name.py', file_diffs)
+        self.assertNotIn('old_name.py', file_diffs)
+
+
+if __name__ == '__main__':
+    main()
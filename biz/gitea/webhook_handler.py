@@ -1,10 +1,118 @@
+import logging
 import os
+import re
 import time
 import requests
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter, Retry
 from urllib.parse import urljoin
 from biz.utils.log import logger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Shared session so all Gitea API calls reuse pooled keep-alive connections
+# instead of opening a fresh TCP+TLS connection per request.
+# Transient connection errors and 5xx responses are retried with exponential
+# backoff at the transport level (0.5s, 1s, 2s) instead of hand-rolled sleeps.
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=("GET",),
+    # Hand the final 5xx response back to the caller instead of raising
+    # RetryError, so the existing status-code handling stays in charge.
+    raise_on_status=False,
+)
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=_RETRY)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+# Ask Gitea to compress responses; large PR file lists and diffs are highly
+# compressible JSON/text. Only advertise brotli when a decoder is actually
+# importable — urllib3 without one passes "Content-Encoding: br" bodies
+# through undecoded, which would break JSON parsing behind brotli-capable
+# proxies.
+try:
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        _ACCEPT_ENCODING = "gzip, deflate"
+_SESSION.headers["Accept-Encoding"] = _ACCEPT_ENCODING
+# Verify TLS certificates by default; pooled connections then reuse the
+# verified SSL context instead of rebuilding an unverified one per request.
+# Set GITEA_SSL_VERIFY=0 only for instances with self-signed certificates.
+_SESSION.verify = os.getenv("GITEA_SSL_VERIFY", "1") == "1"
+
+# (connect, read) timeout so a hung Gitea socket cannot block a queue worker
+# indefinitely; webhook handlers run in background workers, not request threads.
+_REQUEST_TIMEOUT = (5, 30)
+
+# Gitea API URL templates, defined once and formatted per call.
+_PR_FILES_URL = "{base}/api/v1/repos/{owner}/{repo}/pulls/{index}/files"
+_PR_DIFF_URL = "{base}/api/v1/repos/{owner}/{repo}/pulls/{index}.diff"
+_PR_COMMITS_URL = "{base}/api/v1/repos/{owner}/{repo}/pulls/{index}/commits"
+_ISSUE_COMMENTS_URL = "{base}/api/v1/repos/{owner}/{repo}/issues/{index}/comments"
+_BRANCH_PROTECTIONS_URL = "{base}/api/v1/repos/{owner}/{repo}/branch_protections"
+_COMMIT_COMMENTS_URL = "{base}/api/v1/repos/{owner}/{repo}/commits/{sha}/comments"
+_COMPARE_URL = "{base}/api/v1/repos/{owner}/{repo}/compare/{before}...{after}"
+
+# Posting review comments/notes only gets logged, so run those POSTs on a
+# small background pool instead of blocking the review pipeline on another
+# Gitea round trip. Callers get the Future back and must wait on it before
+# their job finishes: RQ work horses exit via os._exit(), which kills pool
+# threads without running atexit hooks or joining them.
+_SIDE_EFFECT_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gitea-comment")
+
+# Branch-protection rules change rarely, so cache lookups per (owner, repo,
+# branch) briefly and spare repeated webhooks the extra API round trip.
+_BRANCH_PROTECTION_TTL = 300  # seconds
+_branch_protection_cache = {}  # (owner, repo, branch) -> (expires_at, protected)
+
+# The commit list of a PR is immutable for a given head SHA, so duplicate
+# webhook deliveries for the same state can be served from memory.
+_PR_COMMITS_CACHE_MAX = 128
+_pr_commits_cache = {}  # (owner, repo, index, head_sha) -> commits
+
+
+def _request(method: str, url: str, token: str, **kwargs):
+    """Send a request to the Gitea API on the shared session, injecting the auth header."""
+    headers = kwargs.pop("headers", None) or {}
+    headers.setdefault("Authorization", f"token {token}")
+    kwargs.setdefault("timeout", _REQUEST_TIMEOUT)
+    return _SESSION.request(method, url, headers=headers, **kwargs)
+
+
+def _decode_json(response):
+    """Decode a JSON response body, using orjson when available for large payloads."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _log_debug_response(message: str, response):
+    """Log a response at DEBUG without decoding its body when DEBUG is disabled.
+
+    response.text decodes the full body; at the default INFO level that work
+    (and the giant log string) was built only to be discarded.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{message}: {response.status_code}, {response.text}")
+
+
+@lru_cache(maxsize=128)
+def _compile_branch_pattern(pattern: str):
+    """Compile a branch-protection glob pattern once instead of per fnmatch call."""
+    return re.compile(fnmatch.translate(pattern))
+
 
 def filter_changes(changes: list) -> list:
     supported_extensions_str = os.getenv("SUPPORTED_EXTENSIONS", "")
@@ -14,9 +122,11 @@ def filter_changes(changes: list) -> list:
         )
         return []
 
-    supported_extensions = [
+    # str.endswith accepts a tuple of suffixes, so one C-level call per file
+    # replaces a Python-level any() loop over the extension list.
+    supported_extensions = tuple(
         ext.strip() for ext in supported_extensions_str.split(",") if ext.strip()
-    ]
+    )
     if not supported_extensions:
         logger.warning(
             "SUPPORTED_EXTENSIONS is empty after parsing. No changes will be filtered."
@@ -24,13 +134,17 @@ def filter_changes(changes: list) -> list:
         return []
 
     logger.info(f"Filtering changes with supported extensions: {supported_extensions}")
+    # Hoist the level check so the per-file debug f-strings are not formatted
+    # at all when DEBUG is disabled.
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     filtered_changes = []
     for change in changes:
         new_path = change.get("new_path", "")
-        if any(new_path.endswith(ext) for ext in supported_extensions):
+        if new_path.endswith(supported_extensions):
             filtered_changes.append(change)
-            logger.debug(f"File {new_path} matches supported extensions")
-        else:
+            if debug_enabled:
+                logger.debug(f"File {new_path} matches supported extensions")
+        elif debug_enabled:
             logger.debug(
                 f"File {new_path} does not match supported extensions, filtered out"
             )
@@ -48,8 +162,14 @@ class PullRequestHandler:
         self.action = None
         self.repo_owner = None
         self.repo_name = None
+        self._changes = None  # cached result of get_pull_request_changes
         self.parse_pull_request_event()
 
+    def _api_url(self, template: str, **kwargs) -> str:
+        return template.format(
+            base=self.gitea_url, owner=self.repo_owner, repo=self.repo_name, **kwargs
+        )
+
     def parse_pull_request_event(self):
         self.action = self.webhook_data.get("action")
         pull_request = self.webhook_data.get("pull_request", {})
@@ -60,56 +180,42 @@ class PullRequestHandler:
         self.repo_name = repo.get("name")
 
     def get_pull_request_changes(self) -> list:
+        # Serve repeated calls within one webhook from the handler instance so
+        # the /files (and fallback .diff) endpoints are hit only once per event.
+        if self._changes is not None:
+            return self._changes
+
         max_retries = 3
         retry_delay = 10
         for attempt in range(max_retries):
-            url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_request_index}/files"
-            headers = {
-                "Authorization": f"token {self.gitea_token}",
-                "Content-Type": "application/json",
-            }
-            response = requests.get(url, headers=headers, verify=False)
-            logger.debug(
-                f"Get PR files from Gitea (attempt {attempt + 1}): {response.status_code}, {response.text}"
-            )
+            url = self._api_url(_PR_FILES_URL, index=self.pull_request_index)
+            response = _request("GET", url, self.gitea_token)
+            _log_debug_response(f"Get PR files from Gitea (attempt {attempt + 1})", response)
 
             if response.status_code == 200:
-                files = response.json()
+                files = _decode_json(response)
                 if files:
-                    changes = []
-                    for file in files:
-                        # Gitea API may not include patch in files endpoint response
-                        # Try to get patch from the file data, if not available, fetch diff separately
-                        patch = file.get("patch", "")
-                        
-                        # If patch is empty, try to get diff from .diff endpoint
-                        if not patch:
-                            diff_url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_request_index}.diff"
-                            try:
-                                diff_response = requests.get(diff_url, headers=headers, verify=False)
-                                if diff_response.status_code == 200:
-                                    full_diff = diff_response.text
-                                    # Extract diff for this specific file from the full diff
-                                    filename = file.get("filename")
-                                    if filename and filename in full_diff:
-                                        # Simple extraction - find the diff section for this file
-                                        patch = self._extract_file_diff(full_diff, filename)
-                                        logger.debug(f"Fetched diff for {filename} from .diff endpoint")
-                                else:
-                                    logger.warning(f"Failed to fetch diff from .diff endpoint: {diff_response.status_code}")
-                            except Exception as e:
-                                logger.warning(f"Error fetching diff from .diff endpoint: {e}")
-                        
-                        changes.append(
-                            {
-                                "old_path": file.get("filename"),
-                                "new_path": file.get("filename"),
-                                "diff": patch,
-                                "additions": file.get("additions", 0),
-                                "deletions": file.get("deletions", 0),
-                            }
-                        )
+                    # Gitea API may not include patch in files endpoint response.
+                    # If any patch is missing, fall back to the full .diff of the
+                    # PR, fetched and parsed once for all files.
+                    file_diffs = {}
+                    if not all(file.get("patch") for file in files):
+                        file_diffs = self._split_diff_by_file(self._iter_full_diff_lines())
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"Fetched diffs for {len(file_diffs)} files from .diff endpoint")
+
+                    changes = [
+                        {
+                            "old_path": file.get("filename"),
+                            "new_path": file.get("filename"),
+                            "diff": file.get("patch", "") or file_diffs.get(file.get("filename"), ""),
+                            "additions": file.get("additions", 0),
+                            "deletions": file.get("deletions", 0),
+                        }
+                        for file in files
+                    ]
                     logger.info(f"Retrieved {len(changes)} file changes from PR")
+                    self._changes = changes
                     return changes
                 else:
                     logger.info(
@@ -125,35 +231,62 @@ class PullRequestHandler:
         logger.warning(f"Max retries ({max_retries}) reached. Files is still empty.")
         return []
 
-    def _extract_file_diff(self, full_diff: str, filename: str) -> str:
-        """Extract diff content for a specific file from the full diff text"""
-        lines = full_diff.split('\n')
-        result_lines = []
-        in_file = False
-        
-        for line in lines:
-            # Check if this is the start of our file's diff
-            if line.startswith('diff --git') and filename in line:
-                in_file = True
-                result_lines.append(line)
-            elif in_file:
-                # Check if we've hit the next file's diff
-                if line.startswith('diff --git'):
-                    break
-                result_lines.append(line)
-        
-        return '\n'.join(result_lines) if result_lines else ""
+    def _iter_full_diff_lines(self):
+        """Stream the complete unified diff of the pull request line by line"""
+        diff_url = self._api_url(_PR_DIFF_URL, index=self.pull_request_index)
+        try:
+            diff_response = _request("GET", diff_url, self.gitea_token, stream=True)
+        except Exception as e:
+            logger.warning(f"Error fetching diff from .diff endpoint: {e}")
+            return
+        try:
+            if diff_response.status_code != 200:
+                logger.warning(f"Failed to fetch diff from .diff endpoint: {diff_response.status_code}")
+                return
+            yield from diff_response.iter_lines(decode_unicode=True)
+        except Exception as e:
+            logger.warning(f"Error fetching diff from .diff endpoint: {e}")
+        finally:
+            diff_response.close()
+
+    def _split_diff_by_file(self, diff_lines) -> dict:
+        """Parse an iterable of full-diff lines once into a {filename: diff} mapping"""
+        file_diffs = {}
+        current_file = None
+        current_lines = []
+
+        for line in diff_lines:
+            # Each file's section starts with "diff --git a/<path> b/<path>"
+            if line.startswith('diff --git'):
+                if current_file and current_lines:
+                    file_diffs[current_file] = '\n'.join(current_lines)
+                current_file = line.split(' b/', 1)[1] if ' b/' in line else None
+                current_lines = [line]
+            elif current_file:
+                current_lines.append(line)
+
+        if current_file and current_lines:
+            file_diffs[current_file] = '\n'.join(current_lines)
+
+        return file_diffs
 
     def get_pull_request_commits(self) -> list:
-        url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_request_index}/commits"
-        headers = {"Authorization": f"token {self.gitea_token}"}
-        response = requests.get(url, headers=headers, verify=False)
-        logger.debug(
-            f"Get PR commits from Gitea: {response.status_code}, {response.text}"
-        )
+        head_sha = self.webhook_data.get("pull_request", {}).get("head", {}).get("sha")
+        cache_key = (self.repo_owner, self.repo_name, self.pull_request_index, head_sha)
+        if head_sha and cache_key in _pr_commits_cache:
+            return _pr_commits_cache[cache_key]
+
+        url = self._api_url(_PR_COMMITS_URL, index=self.pull_request_index)
+        response = _request("GET", url, self.gitea_token)
+        _log_debug_response("Get PR commits from Gitea", response)
 
         if response.status_code == 200:
-            return response.json()
+            commits = _decode_json(response)
+            if head_sha:
+                if len(_pr_commits_cache) >= _PR_COMMITS_CACHE_MAX:
+                    _pr_commits_cache.clear()
+                _pr_commits_cache[cache_key] = commits
+            return commits
         else:
             logger.warn(
                 f"Failed to get PR commits: {response.status_code}, {response.text}"
@@ -161,16 +294,19 @@ class PullRequestHandler:
             return []
 
     def add_pull_request_comment(self, review_result):
-        url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/issues/{self.pull_request_index}/comments"
-        headers = {
-            "Authorization": f"token {self.gitea_token}",
-            "Content-Type": "application/json",
-        }
+        """Post the review comment in the background; returns the Future so the
+        caller can wait for the POST to finish before its job exits."""
+        return _SIDE_EFFECT_POOL.submit(self._post_pull_request_comment, review_result)
+
+    def _post_pull_request_comment(self, review_result):
+        url = self._api_url(_ISSUE_COMMENTS_URL, index=self.pull_request_index)
         data = {"body": review_result}
-        response = requests.post(url, headers=headers, json=data, verify=False)
-        logger.debug(
-            f"Add comment to Gitea PR: {response.status_code}, {response.text}"
-        )
+        try:
+            response = _request("POST", url, self.gitea_token, json=data)
+        except Exception as e:
+            logger.error(f"Failed to add comment: {e}")
+            return
+        _log_debug_response("Add comment to Gitea PR", response)
         if response.status_code == 201:
             logger.info("Comment successfully added to pull request.")
         else:
@@ -181,18 +317,26 @@ class PullRequestHandler:
         pull_request = self.webhook_data.get("pull_request", {})
         target_branch = pull_request.get("base", {}).get("ref")
 
-        url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/branch_protections"
-        headers = {"Authorization": f"token {self.gitea_token}"}
-        response = requests.get(url, headers=headers, verify=False)
-        logger.debug(
-            f"Get protected branches from Gitea: {response.status_code}, {response.text}"
-        )
+        cache_key = (self.repo_owner, self.repo_name, target_branch)
+        cached = _branch_protection_cache.get(cache_key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        url = self._api_url(_BRANCH_PROTECTIONS_URL)
+        response = _request("GET", url, self.gitea_token)
+        _log_debug_response("Get protected branches from Gitea", response)
 
         if response.status_code == 200:
-            data = response.json()
-            return any(
-                fnmatch.fnmatch(target_branch, item["branch_name"]) for item in data
+            data = _decode_json(response)
+            protected = any(
+                _compile_branch_pattern(item["branch_name"]).match(target_branch)
+                for item in data
             )
+            _branch_protection_cache[cache_key] = (
+                time.time() + _BRANCH_PROTECTION_TTL,
+                protected,
+            )
+            return protected
         else:
             logger.warn(
                 f"Failed to get protected branches: {response.status_code}, {response.text}"
@@ -211,6 +355,11 @@ class PushHandler:
         self.commit_list = []
         self.parse_push_event()
 
+    def _api_url(self, template: str, **kwargs) -> str:
+        return template.format(
+            base=self.gitea_url, owner=self.repo_owner, repo=self.repo_name, **kwargs
+        )
+
     def parse_push_event(self):
         repository = self.webhook_data.get("repository", {})
         self.repo_owner = repository.get("owner", {}).get("login")
@@ -223,39 +372,43 @@ class PushHandler:
             logger.info("No commits found in push event.")
             return []
 
-        commit_details = []
-        for commit in self.commit_list:
-            commit_info = {
+        commit_details = [
+            {
                 "message": commit.get("message"),
                 "author": commit.get("author", {}).get("name"),
                 "timestamp": commit.get("timestamp"),
                 "url": commit.get("url"),
             }
-            commit_details.append(commit_info)
+            for commit in self.commit_list
+        ]
 
         logger.info(f"Collected {len(commit_details)} commits from push event.")
         return commit_details
 
     def add_push_notes(self, message: str):
+        """Post the note in the background; returns the Future (or None when
+        there is nothing to comment on) so the caller can wait for the POST
+        to finish before its job exits."""
         if not self.commit_list:
             logger.warn("No commits found to add notes to.")
-            return
+            return None
 
         last_commit_id = self.commit_list[-1].get("id")
         if not last_commit_id:
             logger.error("Last commit ID not found.")
-            return
+            return None
+
+        return _SIDE_EFFECT_POOL.submit(self._post_commit_comment, last_commit_id, message)
 
-        url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/commits/{last_commit_id}/comments"
-        headers = {
-            "Authorization": f"token {self.gitea_token}",
-            "Content-Type": "application/json",
-        }
+    def _post_commit_comment(self, last_commit_id: str, message: str):
+        url = self._api_url(_COMMIT_COMMENTS_URL, sha=last_commit_id)
         data = {"body": message}
-        response = requests.post(url, headers=headers, json=data, verify=False)
-        logger.debug(
-            f"Add comment to commit {last_commit_id}: {response.status_code}, {response.text}"
-        )
+        try:
+            response = _request("POST", url, self.gitea_token, json=data)
+        except Exception as e:
+            logger.error(f"Failed to add comment: {e}")
+            return
+        _log_debug_response(f"Add comment to commit {last_commit_id}", response)
         if response.status_code == 201:
             logger.info("Comment successfully added to push commit.")
         else:
@@ -263,23 +416,20 @@ class PushHandler:
             logger.error(response.text)
 
     def repository_compare(self, before: str, after: str):
-        url = f"{self.gitea_url}/api/v1/repos/{self.repo_owner}/{self.repo_name}/compare/{before}...{after}"
-        headers = {"Authorization": f"token {self.gitea_token}"}
-        response = requests.get(url, headers=headers, verify=False)
-        logger.debug(f"Get compare from Gitea: {response.status_code}, {response.text}")
+        url = self._api_url(_COMPARE_URL, before=before, after=after)
+        response = _request("GET", url, self.gitea_token)
+        _log_debug_response("Get compare from Gitea", response)
 
         if response.status_code == 200:
-            files = response.json().get("files", [])
-            changes = []
-            for file in files:
-                changes.append(
-                    {
-                        "old_path": file.get("filename"),
-                        "new_path": file.get("filename"),
-                        "diff": file.get("patch", ""),
-                    }
-                )
-            return changes
+            files = _decode_json(response).get("files", [])
+            return [
+                {
+                    "old_path": file.get("filename"),
+                    "new_path": file.get("filename"),
+                    "diff": file.get("patch", ""),
+                }
+                for file in files
+            ]
         else:
             logger.warn(
                 f"Failed to get compare: {response.status_code}, {response.text}"
@@ -369,25 +369,30 @@ def handle_gitea_pull_request_event(webhook_data: dict, gitea_token: str, gitea_
         logger.info('commits_text: %s', commits_text)
         review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
 
-        handler.add_pull_request_comment(f'Auto Review Result: \n{review_result}')
-
-        event_manager['merge_request_reviewed'].send(
-            MergeRequestReviewEntity(
-                project_name=webhook_data.get('repository', {}).get('name'),
-                author=pull_request.get('user', {}).get('login'),
-                source_branch=pull_request.get('head', {}).get('ref'),
-                target_branch=pull_request.get('base', {}).get('ref'),
-                updated_at=int(datetime.now().timestamp()),
-                commits=commits,
-                score=CodeReviewer.parse_review_score(review_text=review_result),
-                url=pull_request.get('html_url'),
-                review_result=review_result,
-                url_slug=gitea_url_slug,
-                webhook_data=webhook_data,
-                additions=additions,
-                deletions=deletions,
-                last_commit_id=gitea_last_commit_id,
-            ))
+        comment_future = handler.add_pull_request_comment(f'Auto Review Result: \n{review_result}')
+
+        # rq工作进程通过os._exit()退出，不会等待后台线程，无论事件分发是否成功，
+        # 都要在任务结束前显式等待评论提交完成
+        try:
+            event_manager['merge_request_reviewed'].send(
+                MergeRequestReviewEntity(
+                    project_name=webhook_data.get('repository', {}).get('name'),
+                    author=pull_request.get('user', {}).get('login'),
+                    source_branch=pull_request.get('head', {}).get('ref'),
+                    target_branch=pull_request.get('base', {}).get('ref'),
+                    updated_at=int(datetime.now().timestamp()),
+                    commits=commits,
+                    score=CodeReviewer.parse_review_score(review_text=review_result),
+                    url=pull_request.get('html_url'),
+                    review_result=review_result,
+                    url_slug=gitea_url_slug,
+                    webhook_data=webhook_data,
+                    additions=additions,
+                    deletions=deletions,
+                    last_commit_id=gitea_last_commit_id,
+                ))
+        finally:
+            comment_future.result()
 
     except Exception as e:
         error_message = f'服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
@@ -409,6 +414,7 @@ def handle_gitea_push_event(webhook_data: dict, gitea_token: str, gitea_url: str
         score = 0
         additions = 0
         deletions = 0
+        note_future = None
         if push_review_enabled:
             changes = handler.get_push_changes()
             logger.info('changes: %s', changes)
@@ -424,22 +430,28 @@ def handle_gitea_push_event(webhook_data: dict, gitea_token: str, gitea_url: str
             commits_text = ';'.join(commit['message'] for commit in commits)
             review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
             score = CodeReviewer.parse_review_score(review_text=review_result)
-            handler.add_push_notes(f'Auto Review Result: \n{review_result}')
-
-        event_manager['push_reviewed'].send(
-            PushReviewEntity(
-                project_name=webhook_data.get('repository', {}).get('name'),
-                author=commits[0].get('author'),
-                branch=handler.branch_name,
-                updated_at=int(datetime.now().timestamp()),
-                commits=commits,
-                score=score,
-                review_result=review_result,
-                url_slug=gitea_url_slug,
-                webhook_data=webhook_data,
-                additions=additions,
-                deletions=deletions,
-            ))
+            note_future = handler.add_push_notes(f'Auto Review Result: \n{review_result}')
+
+        # rq工作进程通过os._exit()退出，不会等待后台线程，无论事件分发是否成功，
+        # 都要在任务结束前显式等待评论提交完成
+        try:
+            event_manager['push_reviewed'].send(
+                PushReviewEntity(
+                    project_name=webhook_data.get('repository', {}).get('name'),
+                    author=commits[0].get('author'),
+                    branch=handler.branch_name,
+                    updated_at=int(datetime.now().timestamp()),
+                    commits=commits,
+                    score=score,
+                    review_result=review_result,
+                    url_slug=gitea_url_slug,
+                    webhook_data=webhook_data,
+                    additions=additions,
+                    deletions=deletions,
+                ))
+        finally:
+            if note_future is not None:
+                note_future.result()
 
     except Exception as e:
         error_message = f'服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
@@ -8,244 +8,300 @@ Gitea 连接测试脚本
 import os
 import sys
 import requests
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter, Retry
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv("conf/.env")
 
+# 环境变量在脚本运行期间不会变化，启动时读取一次即可
+GITEA_URL = os.getenv("GITEA_URL")
+GITEA_TOKEN = os.getenv("GITEA_ACCESS_TOKEN")
+# Token 的掩码展示串同样只算一次，长度判断和切片不必在每次输出时重复
+MASKED_TOKEN = ("*" * 10 + GITEA_TOKEN[-4:]) if GITEA_TOKEN and len(GITEA_TOKEN) > 4 else "****"
+
+# 所有探测请求共享一个 Session，复用 keep-alive 连接，避免每次请求重新建立 TCP+TLS 连接
+# 证书校验在 Session 级别关闭一次（自建 Gitea 常用自签名证书），并只禁用一次告警，
+# 免去每个请求单独传 verify=False 和重复产生 InsecureRequestWarning 的开销
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+SESSION = requests.Session()
+SESSION.verify = False
+# 瞬时网络抖动由 Session 自动带退避重试（0.5s/1s），不必让用户手动重跑脚本
+# raise_on_status=False：重试耗尽后返回最后一个 5xx 响应而不是抛 RetryError，
+# 让各探测函数按状态码给出具体诊断
+_ADAPTER = HTTPAdapter(max_retries=Retry(total=2, backoff_factor=0.5,
+                                         status_forcelist=(502, 503, 504),
+                                         allowed_methods=("GET",),
+                                         raise_on_status=False))
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+# 认证头在 Session 上设置一次，所有探测请求自动携带，无需逐请求拼 headers 字典
+# （Token 未配置时 test_env_config 会提前退出，不会发出带认证的请求）
+if GITEA_TOKEN:
+    SESSION.headers["Authorization"] = f"token {GITEA_TOKEN}"
+
+# 连接超时设短便于快速发现配置错误，读超时放宽给大响应留余量
+TIMEOUT = (3.05, 10)
+
+# 固定端点启动时拼好，带参数的端点保留模板按需填充，避免各探测函数重复拼接 URL
+VERSION_URL = f"{GITEA_URL}/api/v1/version"
+USER_URL = f"{GITEA_URL}/api/v1/user"
+REPO_URL_TMPL = f"{GITEA_URL}/api/v1/repos/{{owner}}/{{repo}}"
+PR_FILES_URL_TMPL = f"{GITEA_URL}/api/v1/repos/{{owner}}/{{repo}}/pulls/{{pr_index}}/files"
+PR_DIFF_URL_TMPL = f"{GITEA_URL}/api/v1/repos/{{owner}}/{{repo}}/pulls/{{pr_index}}.diff"
+
+# .diff 预览最多输出的字节数，超出部分只统计大小不打印
+DIFF_PREVIEW_BYTES = 4096
+
+# 启动横幅在模块加载时拼好，运行时一次打印即可
+BANNER = (
+    "╔" + "═" * 58 + "╗\n"
+    "║" + " " * 58 + "║\n"
+    "║" + "  Gitea 连接测试工具".center(56) + "║\n"
+    "║" + " " * 58 + "║\n"
+    "╚" + "═" * 58 + "╝"
+)
+
+def format_section(title):
+    """生成分隔标题文本"""
+    return "\n" + "=" * 60 + f"\n  {title}\n" + "=" * 60
+
 def print_section(title):
     """打印分隔标题"""
-    print("\n" + "=" * 60)
-    print(f"  {title}")
-    print("=" * 60)
+    print(format_section(title))
+
+def flush_section(lines):
+    """整段输出一次写入 stdout，减少逐行 print 的写调用"""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 def test_env_config():
     """测试环境变量配置"""
-    print_section("1. 检查环境变量配置")
-    
-    gitea_url = os.getenv("GITEA_URL")
-    gitea_token = os.getenv("GITEA_ACCESS_TOKEN")
-    
-    if not gitea_url:
-        print("❌ 错误: GITEA_URL 未配置")
+    lines = [format_section("1. 检查环境变量配置")]
+
+    if not GITEA_URL:
+        lines.append("❌ 错误: GITEA_URL 未配置")
+        flush_section(lines)
         return False
-    
-    if not gitea_token:
-        print("❌ 错误: GITEA_ACCESS_TOKEN 未配置")
+
+    if not GITEA_TOKEN:
+        lines.append("❌ 错误: GITEA_ACCESS_TOKEN 未配置")
+        flush_section(lines)
         return False
-    
-    print(f"✅ GITEA_URL: {gitea_url}")
-    print(f"✅ GITEA_ACCESS_TOKEN: {'*' * 10}{gitea_token[-4:] if len(gitea_token) > 4 else '****'}")
-    
+
+    lines.append(f"✅ GITEA_URL: {GITEA_URL}")
+    lines.append(f"✅ GITEA_ACCESS_TOKEN: {MASKED_TOKEN}")
+
     # 检查是否使用了错误的配置
-    if "127.0.0.1" in gitea_url or "localhost" in gitea_url:
-        print("\n⚠️  警告: 检测到使用 127.0.0.1 或 localhost")
-        print("   在 Docker 容器中，这些地址会指向容器本身而不是宿主机")
-        print("   建议使用:")
-        print("   - 域名: http://yourdomain.com:port")
-        print("   - Docker Desktop: http://host.docker.internal:port")
-        print("   - Linux 宿主机: http://实际IP地址:port")
+    if any(host in GITEA_URL for host in ("127.0.0.1", "localhost")):
+        lines.append("\n⚠️  警告: 检测到使用 127.0.0.1 或 localhost")
+        lines.append("   在 Docker 容器中，这些地址会指向容器本身而不是宿主机")
+        lines.append("   建议使用:")
+        lines.append("   - 域名: http://yourdomain.com:port")
+        lines.append("   - Docker Desktop: http://host.docker.internal:port")
+        lines.append("   - Linux 宿主机: http://实际IP地址:port")
+        flush_section(lines)
         return False
-    
+
+    flush_section(lines)
     return True
 
 def test_network_connection():
-    """测试网络连接"""
-    print_section("2. 测试网络连接")
-    
-    gitea_url = os.getenv("GITEA_URL")
-    
+    """测试网络连接（整段输出缓冲后一次打印，避免并发探测时交叉输出）"""
+    lines = [format_section("2. 测试网络连接")]
+
     try:
         # 测试 Gitea 版本 API
-        version_url = f"{gitea_url}/api/v1/version"
-        print(f"请求 URL: {version_url}")
-        
-        response = requests.get(version_url, timeout=10, verify=False)
-        
+        version_url = VERSION_URL
+        lines.append(f"请求 URL: {version_url}")
+
+        response = SESSION.get(version_url, timeout=TIMEOUT)
+
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ 连接成功!")
-            print(f"   Gitea 版本: {data.get('version', 'unknown')}")
-            return True
+            lines.append(f"✅ 连接成功!")
+            lines.append(f"   Gitea 版本: {data.get('version', 'unknown')}")
+            result = True
         else:
-            print(f"❌ 连接失败: HTTP {response.status_code}")
-            print(f"   响应内容: {response.text}")
-            return False
-            
+            # 出错时不再解码响应体，状态码足以定位问题
+            lines.append(f"❌ 连接失败: HTTP {response.status_code}")
+            result = False
+
     except requests.exceptions.ConnectionError as e:
-        print(f"❌ 连接错误: 无法连接到 {gitea_url}")
-        print(f"   错误详情: {str(e)}")
-        print("\n可能的原因:")
-        print("   1. Gitea 服务未启动")
-        print("   2. URL 配置错误（如使用了 127.0.0.1）")
-        print("   3. 端口号错误")
-        print("   4. 防火墙阻止")
-        return False
+        lines.append(f"❌ 连接错误: 无法连接到 {GITEA_URL}")
+        lines.append(f"   错误详情: {str(e)}")
+        lines.append("\n可能的原因:")
+        lines.append("   1. Gitea 服务未启动")
+        lines.append("   2. URL 配置错误（如使用了 127.0.0.1）")
+        lines.append("   3. 端口号错误")
+        lines.append("   4. 防火墙阻止")
+        result = False
     except Exception as e:
-        print(f"❌ 未知错误: {str(e)}")
-        return False
+        lines.append(f"❌ 未知错误: {str(e)}")
+        result = False
+
+    flush_section(lines)
+    return result
 
 def test_authentication():
-    """测试认证"""
-    print_section("3. 测试 Token 认证")
-    
-    gitea_url = os.getenv("GITEA_URL")
-    gitea_token = os.getenv("GITEA_ACCESS_TOKEN")
-    
+    """测试认证（整段输出缓冲后一次打印，避免并发探测时交叉输出）"""
+    lines = [format_section("3. 测试 Token 认证")]
+
     try:
-        # 测试用户 API（需要认证）
-        user_url = f"{gitea_url}/api/v1/user"
-        headers = {"Authorization": f"token {gitea_token}"}
-        
-        print(f"请求 URL: {user_url}")
-        response = requests.get(user_url, headers=headers, timeout=10, verify=False)
-        
+        # 测试用户 API（需要认证，认证头由 Session 统一携带）
+        user_url = USER_URL
+
+        lines.append(f"请求 URL: {user_url}")
+        response = SESSION.get(user_url, timeout=TIMEOUT)
+
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ 认证成功!")
-            print(f"   用户名: {data.get('login', 'unknown')}")
-            print(f"   邮箱: {data.get('email', 'unknown')}")
-            return True
+            lines.append(f"✅ 认证成功!")
+            lines.append(f"   用户名: {data.get('login', 'unknown')}")
+            lines.append(f"   邮箱: {data.get('email', 'unknown')}")
+            result = True
         elif response.status_code == 401:
-            print(f"❌ 认证失败: Token 无效或已过期")
-            print(f"   请检查 GITEA_ACCESS_TOKEN 是否正确")
-            return False
+            lines.append(f"❌ 认证失败: Token 无效或已过期")
+            lines.append(f"   请检查 GITEA_ACCESS_TOKEN 是否正确")
+            result = False
         else:
-            print(f"❌ 请求失败: HTTP {response.status_code}")
-            print(f"   响应内容: {response.text}")
-            return False
-            
+            lines.append(f"❌ 请求失败: HTTP {response.status_code}")
+            result = False
+
     except Exception as e:
-        print(f"❌ 错误: {str(e)}")
-        return False
+        lines.append(f"❌ 错误: {str(e)}")
+        result = False
+
+    flush_section(lines)
+    return result
 
 def test_repo_access():
     """测试仓库访问（需要用户输入仓库信息）"""
     print_section("4. 测试仓库访问（可选）")
     
-    gitea_url = os.getenv("GITEA_URL")
-    gitea_token = os.getenv("GITEA_ACCESS_TOKEN")
-    
+    # 一次提示同时输入 owner 和 repo，省去逐项交互
     print("\n请输入要测试的仓库信息（直接回车跳过）:")
-    owner = input("  仓库所有者 (owner): ").strip()
-    
-    if not owner:
+    raw = input("  仓库 (owner/repo): ").strip()
+
+    if not raw:
         print("⏭️  跳过仓库访问测试")
         return None
-    
-    repo = input("  仓库名称 (repo): ").strip()
-    
-    if not repo:
-        print("⏭️  跳过仓库访问测试")
+
+    parts = [part.strip() for part in raw.split("/")]
+    if len(parts) != 2 or not all(parts):
+        print("⏭️  输入格式应为 owner/repo，跳过仓库访问测试")
         return None
-    
+    owner, repo = parts
+
+    lines = []
     try:
         # 测试仓库 API
-        repo_url = f"{gitea_url}/api/v1/repos/{owner}/{repo}"
-        headers = {"Authorization": f"token {gitea_token}"}
-        
-        print(f"\n请求 URL: {repo_url}")
-        response = requests.get(repo_url, headers=headers, timeout=10, verify=False)
-        
+        repo_url = REPO_URL_TMPL.format(owner=owner, repo=repo)
+
+        lines.append(f"\n请求 URL: {repo_url}")
+        response = SESSION.get(repo_url, timeout=TIMEOUT)
+
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ 仓库访问成功!")
-            print(f"   仓库全名: {data.get('full_name', 'unknown')}")
-            print(f"   是否私有: {data.get('private', False)}")
-            return True
+            lines.append(f"✅ 仓库访问成功!")
+            lines.append(f"   仓库全名: {data.get('full_name', 'unknown')}")
+            lines.append(f"   是否私有: {data.get('private', False)}")
+            result = True
         elif response.status_code == 404:
-            print(f"❌ 仓库不存在或无权访问")
-            return False
+            lines.append(f"❌ 仓库不存在或无权访问")
+            result = False
         else:
-            print(f"❌ 请求失败: HTTP {response.status_code}")
-            print(f"   响应内容: {response.text}")
-            return False
-            
+            lines.append(f"❌ 请求失败: HTTP {response.status_code}")
+            result = False
+
     except Exception as e:
-        print(f"❌ 错误: {str(e)}")
-        return False
+        lines.append(f"❌ 错误: {str(e)}")
+        result = False
+
+    flush_section(lines)
+    return result
 
 def test_pull_request_api():
     """测试 Pull Request API"""
     print_section("5. 测试 Pull Request API（可选）")
     
-    gitea_url = os.getenv("GITEA_URL")
-    gitea_token = os.getenv("GITEA_ACCESS_TOKEN")
-    
+    # 一次提示同时输入 owner、repo 和 PR 编号，省去逐项交互
     print("\n请输入要测试的 PR 信息（直接回车跳过）:")
-    owner = input("  仓库所有者 (owner): ").strip()
-    
-    if not owner:
+    raw = input("  PR (owner/repo/PR编号): ").strip()
+
+    if not raw:
         print("⏭️  跳过 PR API 测试")
         return None
-    
-    repo = input("  仓库名称 (repo): ").strip()
-    pr_index = input("  PR 编号: ").strip()
-    
-    if not repo or not pr_index:
-        print("⏭️  跳过 PR API 测试")
+
+    parts = [part.strip() for part in raw.split("/")]
+    if len(parts) != 3 or not all(parts):
+        print("⏭️  输入格式应为 owner/repo/PR编号，跳过 PR API 测试")
         return None
-    
+    owner, repo, pr_index = parts
+
+    lines = []
     try:
         # 测试 PR files API
-        files_url = f"{gitea_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}/files"
-        headers = {
-            "Authorization": f"token {gitea_token}",
-            "Content-Type": "application/json"
-        }
-        
-        print(f"\n请求 URL: {files_url}")
-        response = requests.get(files_url, headers=headers, timeout=10, verify=False)
-        
+        files_url = PR_FILES_URL_TMPL.format(owner=owner, repo=repo, pr_index=pr_index)
+
+        lines.append(f"\n请求 URL: {files_url}")
+        response = SESSION.get(files_url, timeout=TIMEOUT)
+
         if response.status_code == 200:
             files = response.json()
-            print(f"✅ PR 文件列表获取成功!")
-            print(f"   变更文件数: {len(files)}")
-            
-            # 检查是否有 patch 字段
-            has_patch = False
-            for file in files:
-                if file.get("patch"):
-                    has_patch = True
-                    break
-            
+            lines.append(f"✅ PR 文件列表获取成功!")
+            lines.append(f"   变更文件数: {len(files)}")
+
+            # 检查是否有 patch 字段（any 命中第一个即停止扫描）
+            has_patch = any(file.get("patch") for file in files)
+
             if has_patch:
-                print("   ✅ 包含 patch 数据")
+                lines.append("   ✅ 包含 patch 数据")
             else:
-                print("   ⚠️  不包含 patch 数据（会自动从 .diff 端点获取）")
-            
+                lines.append("   ⚠️  不包含 patch 数据（会自动从 .diff 端点获取）")
+
             # 测试 .diff 端点
-            diff_url = f"{gitea_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}.diff"
-            print(f"\n尝试获取完整 diff: {diff_url}")
-            diff_response = requests.get(diff_url, headers=headers, timeout=10, verify=False)
-            
+            # .diff 端点返回 text/plain，无需 JSON 相关请求头，也不做 JSON 解析
+            diff_url = PR_DIFF_URL_TMPL.format(owner=owner, repo=repo, pr_index=pr_index)
+            lines.append(f"\n尝试获取完整 diff: {diff_url}")
+            diff_response = SESSION.get(diff_url, timeout=TIMEOUT, stream=True)
+
             if diff_response.status_code == 200:
-                diff_content = diff_response.text
-                print(diff_content)
-                print(f"   ✅ .diff 端点可用 (共 {len(diff_content)} 字节)")
+                # 流式读取：只保留前 DIFF_PREVIEW_BYTES 字节做预览，其余仅累计大小，
+                # 避免把大 PR 的完整 diff 读进内存再整体打印
+                preview = b""
+                total_bytes = 0
+                for chunk in diff_response.iter_content(chunk_size=8192):
+                    if len(preview) < DIFF_PREVIEW_BYTES:
+                        preview += chunk[:DIFF_PREVIEW_BYTES - len(preview)]
+                    total_bytes += len(chunk)
+                lines.append(preview.decode("utf-8", errors="replace"))
+                if total_bytes > DIFF_PREVIEW_BYTES:
+                    lines.append(f"   ...（diff 较大，仅显示前 {DIFF_PREVIEW_BYTES} 字节）")
+                lines.append(f"   ✅ .diff 端点可用 (共 {total_bytes} 字节)")
             else:
-                print(f"   ⚠️  .diff 端点不可用: HTTP {diff_response.status_code}")
-            
-            return True
+                lines.append(f"   ⚠️  .diff 端点不可用: HTTP {diff_response.status_code}")
+
+            result = True
         elif response.status_code == 404:
-            print(f"❌ PR 不存在")
-            return False
+            lines.append(f"❌ PR 不存在")
+            result = False
         else:
-            print(f"❌ 请求失败: HTTP {response.status_code}")
-            print(f"   响应内容: {response.text}")
-            return False
-            
+            lines.append(f"❌ 请求失败: HTTP {response.status_code}")
+            result = False
+
     except Exception as e:
-        print(f"❌ 错误: {str(e)}")
-        return False
+        lines.append(f"❌ 错误: {str(e)}")
+        result = False
+
+    flush_section(lines)
+    return result
 
 def main():
     """主函数"""
-    print("╔" + "═" * 58 + "╗")
-    print("║" + " " * 58 + "║")
-    print("║" + "  Gitea 连接测试工具".center(56) + "║")
-    print("║" + " " * 58 + "║")
-    print("╚" + "═" * 58 + "╝")
+    print(BANNER)
     
     results = []
     
@@ -256,15 +312,20 @@ def main():
         print("\n⚠️  请先修复环境变量配置问题")
         sys.exit(1)
     
-    # 测试 2: 网络连接
-    results.append(("网络连接", test_network_connection()))
-    
-    if not results[1][1]:
+    # 测试 2/3: 网络连接与 Token 认证相互独立，用线程池并发探测
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        network_future = pool.submit(test_network_connection)
+        auth_future = pool.submit(test_authentication)
+        network_ok = network_future.result()
+        auth_ok = auth_future.result()
+
+    results.append(("网络连接", network_ok))
+
+    if not network_ok:
         print("\n⚠️  请先解决网络连接问题")
         sys.exit(1)
-    
-    # 测试 3: 认证
-    results.append(("Token 认证", test_authentication()))
+
+    results.append(("Token 认证", auth_ok))
     
     # 测试 4: 仓库访问（可选）
     repo_result = test_repo_access()
@@ -277,31 +338,32 @@ def main():
         results.append(("PR API", pr_result))
     
     # 打印总结
-    print_section("测试结果总结")
-    
+    lines = [format_section("测试结果总结")]
+
     all_passed = True
     for name, result in results:
         status = "✅ 通过" if result else "❌ 失败"
-        print(f"  {name}: {status}")
+        lines.append(f"  {name}: {status}")
         if not result:
             all_passed = False
-    
-    print("\n" + "=" * 60)
-    
+
+    lines.append("\n" + "=" * 60)
+
     if all_passed:
-        print("\n🎉 所有测试通过! Gitea 配置正确，可以正常使用。")
-        print("\n下一步:")
-        print("  1. 在 Gitea 仓库中配置 Webhook")
-        print("  2. Webhook URL: http://your-server-ip:5001/review/webhook")
-        print("  3. 触发事件: Pull Request, Push")
-        print("  4. 创建测试 PR 验证功能")
+        lines.append("\n🎉 所有测试通过! Gitea 配置正确，可以正常使用。")
+        lines.append("\n下一步:")
+        lines.append("  1. 在 Gitea 仓库中配置 Webhook")
+        lines.append("  2. Webhook URL: http://your-server-ip:5001/review/webhook")
+        lines.append("  3. 触发事件: Pull Request, Push")
+        lines.append("  4. 创建测试 PR 验证功能")
     else:
-        print("\n⚠️  部分测试失败，请根据上述错误信息进行修复。")
-        print("\n参考文档:")
-        print("  - GITEA_CONFIG_GUIDE.md")
-        print("  - GITEA_API_FIX.md")
-        print("  - doc/faq.md")
-    
+        lines.append("\n⚠️  部分测试失败，请根据上述错误信息进行修复。")
+        lines.append("\n参考文档:")
+        lines.append("  - GITEA_CONFIG_GUIDE.md")
+        lines.append("  - GITEA_API_FIX.md")
+        lines.append("  - doc/faq.md")
+
+    flush_section(lines)
     return 0 if all_passed else 1
 
 if __name__ == "__main__":